@@ -0,0 +1,100 @@
+"""
+Startup Benchmark
+
+Measures cold-start cost of the backend:
+- import time of `main`, from `python -X importtime` (with the slowest modules)
+- wall time from launching uvicorn until the first successful HTTP response,
+  with DATABASE_URL pointing at an unreachable Mongo host
+
+Usage:
+    python bench_startup.py [--runs 5] [--top 10]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# TEST-NET-1 address: guaranteed not to route, so connects hang until timeout
+UNREACHABLE_DATABASE_URL = "mongodb://192.0.2.1:27017/?connectTimeoutMS=500"
+
+
+def _bench_env() -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = UNREACHABLE_DATABASE_URL
+    env["DATABASE_NAME"] = "bench"
+    return env
+
+
+def import_time(top: int) -> dict:
+    """Parse `python -X importtime -c 'import main'` output"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=HERE, env=_bench_env(), capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = next(cum for name, _, cum in modules if name == "main")
+    slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+    return {
+        "main_cumulative_ms": round(total_us / 1000, 1),
+        "pymongo_imported": any(name == "pymongo" for name, _, _ in modules),
+        "slowest_self_ms": {name: round(self_us / 1000, 1) for name, self_us, _ in slowest},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_response(timeout: float = 10.0) -> float:
+    """Seconds from spawning uvicorn until GET / returns 200"""
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=HERE, env=_bench_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=0.5) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"server did not respond within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import time and cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    startups = [time_to_first_response() for _ in range(args.runs)]
+    result = {
+        "importtime": import_time(args.top),
+        "first_response_s": {
+            "min": round(min(startups), 3),
+            "median": round(statistics.median(startups), 3),
+            "max": round(max(startups), 3),
+        },
+    }
+    print(json.dumps(result, indent=2))
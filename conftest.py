@@ -0,0 +1,51 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from storage import BulkWriteError, MemoryBackend
+
+
+class FlakyBackend(MemoryBackend):
+    """MemoryBackend standing in for Mongo: raises AutoReconnect while `down`,
+    and rejects documents with a truthy "bad" field like a validation error"""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.insert_calls = 0
+
+    def _check(self):
+        if self.down:
+            raise AutoReconnect("connection refused")
+
+    def insert_one(self, collection_name, document):
+        self.insert_calls += 1
+        self._check()
+        if document.get("bad"):
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        return super().insert_one(collection_name, document)
+
+    def insert_many(self, collection_name, documents):
+        self.insert_calls += 1
+        self._check()
+        errors = [{"index": i, "code": 121, "errmsg": "Document failed validation"}
+                  for i, doc in enumerate(documents) if doc.get("bad")]
+        try:
+            super().insert_many(collection_name, [doc for doc in documents if not doc.get("bad")])
+        except BulkWriteError as e:
+            good = [i for i, doc in enumerate(documents) if not doc.get("bad")]
+            errors += [dict(err, index=good[err["index"]]) for err in e.details["writeErrors"]]
+        if errors:
+            raise BulkWriteError({"writeErrors": sorted(errors, key=lambda err: err["index"])})
+        return [str(doc["_id"]) for doc in documents]
+
+    def find(self, collection_name, filter_dict=None, limit=None, sort=None):
+        self._check()
+        return super().find(collection_name, filter_dict, limit, sort)
+
+    def ping(self):
+        self._check()
+
+
+@pytest.fixture
+def flaky():
+    return FlakyBackend()
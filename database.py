@@ -3,34 +3,119 @@ Database Helper Functions
 
 MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
+
+The Mongo client is created lazily on first use (or at app startup via
+get_db()), so importing this module stays cheap and never touches the network.
+
+Reads and writes go through a storage backend (see storage.py), selected with
+STORAGE_BACKEND:
+- "auto" (default): Mongo, spilling failed writes to a durable on-disk log
+  that is replayed once Mongo recovers (see spill_log.py); in-memory only
+  when DATABASE_URL/DATABASE_NAME are not set
+- "buffered": Mongo, buffering failed writes in memory (not durable)
+- "mongo": Mongo only, errors propagate to the caller
+- "memory": in-memory engine, no Mongo at all
 """
 
-from pymongo import MongoClient
 from datetime import datetime, timezone
+import atexit
 import os
-from dotenv import load_dotenv
+import threading
 from typing import Union
 from pydantic import BaseModel
 
-# Load environment variables from .env file
-load_dotenv()
+from storage import DegradedBackend, MemoryBackend, MongoBackend, Sort, StorageBackend
 
 _client = None
-db = None
+_db = None
+_db_lock = threading.Lock()
+_backend_lock = threading.Lock()
+_initialized = False
+_backend = None
+
+
+def get_db():
+    """Return the Mongo database handle, creating the client on first call"""
+    global _client, _db, _initialized
+    if not _initialized:
+        with _db_lock:
+            if not _initialized:
+                # Deferred: dotenv and pymongo are only needed once we connect
+                from dotenv import load_dotenv
+
+                # Load environment variables from .env file
+                load_dotenv()
+                database_url = os.getenv("DATABASE_URL")
+                database_name = os.getenv("DATABASE_NAME")
+
+                if database_url and database_name:
+                    from pymongo import MongoClient
+
+                    # Fail fast when Mongo is down so queued writes spill instead
+                    # of stalling the writer for pymongo's 30s default
+                    timeout_ms = int(os.getenv("DATABASE_TIMEOUT_MS", 2000))
+                    _client = MongoClient(
+                        database_url,
+                        serverSelectionTimeoutMS=timeout_ms,
+                        connectTimeoutMS=timeout_ms,
+                    )
+                    _db = _client[database_name]
+                _initialized = True
+    return _db
+
 
-database_url = os.getenv("DATABASE_URL")
-database_name = os.getenv("DATABASE_NAME")
+def __getattr__(name: str):
+    # Keeps `from database import db` working without connecting at import time
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_backend() -> StorageBackend:
+    """Return the storage backend, choosing one from STORAGE_BACKEND on first call"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                mode = os.getenv("STORAGE_BACKEND", "auto").lower()
+                db = None if mode == "memory" else get_db()
+                if db is None and mode == "mongo":
+                    raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+                if db is None:
+                    _backend = MemoryBackend()
+                elif mode == "mongo":
+                    _backend = MongoBackend(db)
+                elif mode == "buffered":
+                    _backend = DegradedBackend(MongoBackend(db))
+                else:
+                    from spill_log import SpillLog, SpillingBackend
+
+                    _backend = SpillingBackend(MongoBackend(db), SpillLog())
+                    _backend.start()
+                    # writes are acknowledged before they reach Mongo or disk;
+                    # scripts that never call close_backend() must not lose them
+                    atexit.register(close_backend)
+    return _backend
+
+
+def close_backend():
+    """Flush pending writes and shut the storage backend down (idempotent)"""
+    global _backend
+    with _backend_lock:
+        backend, _backend = _backend, None
+    if backend is not None:
+        backend.close()
+
+
+def set_backend(backend: StorageBackend):
+    """Override the storage backend (tests, benchmarks, load tests)"""
+    global _backend
+    _backend = backend
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
 
 # Helper functions for common database operations
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-
     # Convert Pydantic model to dict if needed
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
@@ -40,16 +125,8 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
+    return get_backend().insert_one(collection_name, data_dict)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None):
     """Get documents from collection"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
-    if limit:
-        cursor = cursor.limit(limit)
-    
-    return list(cursor)
+    return get_backend().find(collection_name, filter_dict, limit, sort)
@@ -0,0 +1,207 @@
+"""
+Intent Classifier
+
+Lightweight statistical intent classifier for the demo receptionist.
+Messages are turned into hashed character n-gram features and scored by a
+linear model (ridge regression, solved in closed form with NumPy) trained
+from the labeled examples in intent_examples.jsonl.
+
+The original keyword rules are kept as a fallback: they are used when NumPy
+or the examples file is unavailable, and when the model is not confident.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+EXAMPLES_PATH = os.getenv(
+    "INTENT_EXAMPLES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_examples.jsonl"),
+)
+
+# Number of hashed feature buckets (must be a power of two)
+FEATURE_DIM = 1 << 14
+# Below this score the keyword rules decide instead of the model
+MIN_CONFIDENCE = 0.25
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_KEYWORDS = {
+    'fr': [
+        ('schedule', ["rendez-vous", "rdv", "planifier", "calendrier", "disponibil"]),
+        ('pricing', ["prix", "tarif", "coût"]),
+        ('escalate', ["humain", "agent", "représentant"]),
+        ('integrations', ["intégration", "google", "outlook", "slack", "zapier", "twilio"]),
+    ],
+    'en': [
+        ('schedule', ["appointment", "book", "schedule", "calendar", "availability"]),
+        ('pricing', ["price", "pricing", "cost"]),
+        ('escalate', ["human", "agent", "representative"]),
+        ('integrations', ["integration", "google", "outlook", "slack", "zapier", "twilio"]),
+    ],
+}
+
+
+def keyword_intent(user: str, lang: str) -> str:
+    """Rule-based intent detection on a lowercased message"""
+    for intent, keywords in _KEYWORDS['fr' if lang == 'fr' else 'en']:
+        if any(k in user for k in keywords):
+            return intent
+    return 'general'
+
+
+def _hash(token: str) -> int:
+    # crc32 is stable across processes, unlike the builtin (salted) hash()
+    return zlib.crc32(token.encode("utf-8")) & (FEATURE_DIM - 1)
+
+
+@lru_cache(maxsize=65536)
+def _word_features(word: str) -> Tuple[int, ...]:
+    # Vocabulary is small and repetitive, so hashing is done once per word
+    padded = f" {word} "
+    grams = ["w:" + word]
+    for n in (2, 3, 4):
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return tuple(_hash(g) for g in grams)
+
+
+def featurize(text: str, lang: str) -> Tuple[List[int], List[float]]:
+    """Hashed, L2-normalised char n-gram (2-4) + word features for one message"""
+    counts = {_hash("__lang:" + lang): 1.0}
+    for word in _WORD_RE.findall(text.lower()):
+        for idx in _word_features(word):
+            counts[idx] = counts.get(idx, 0.0) + 1.0
+    norm = sum(v * v for v in counts.values()) ** 0.5
+    return list(counts), [v / norm for v in counts.values()]
+
+
+class IntentClassifier:
+    """Linear model over hashed features: scores = x @ weights + bias"""
+
+    def __init__(self, weights, bias, labels: Sequence[str], version: str = "unversioned"):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.version = version
+
+    @classmethod
+    def train(cls, examples: Sequence[dict], alpha: float = 0.3) -> "IntentClassifier":
+        """Fit a ridge classifier (one-vs-rest targets) in its dual form.
+
+        With a few hundred examples and thousands of features, solving the
+        n x n system is far cheaper than any iterative optimiser.
+        """
+        import numpy as np
+
+        labels = sorted({ex["intent"] for ex in examples})
+        label_idx = {label: i for i, label in enumerate(labels)}
+
+        X = np.zeros((len(examples), FEATURE_DIM), dtype=np.float32)
+        Y = np.full((len(examples), len(labels)), -1.0, dtype=np.float32)
+        for row, ex in enumerate(examples):
+            idx, vals = featurize(ex["text"], ex.get("lang", "en"))
+            X[row, idx] = vals
+            Y[row, label_idx[ex["intent"]]] = 1.0
+
+        bias = Y.mean(axis=0)
+        K = X @ X.T
+        K[np.diag_indices_from(K)] += alpha
+        dual = np.linalg.solve(K, Y - bias)
+        weights = (X.T @ dual).astype(np.float32)
+        return cls(weights, bias.astype(np.float32), labels)
+
+    @classmethod
+    def from_file(cls, path: str = EXAMPLES_PATH) -> "IntentClassifier":
+        """Train from a JSONL file of {"text", "lang", "intent"} records"""
+        with open(path, "rb") as f:
+            raw = f.read()
+        examples = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+        clf = cls.train(examples)
+        # the examples fully determine the model, so their hash versions it
+        clf.version = hashlib.sha1(raw).hexdigest()[:12]
+        return clf
+
+    def predict(self, text: str, lang: str) -> Tuple[str, float]:
+        """Classify one message, returning (intent, score)"""
+        idx, vals = featurize(text, lang)
+        scores = vals @ self.weights[idx] + self.bias
+        best = int(scores.argmax())
+        return self.labels[best], float(scores[best])
+
+    def predict_batch(self, texts: Sequence[str], langs: Sequence[str]):
+        """Classify many messages at once, returning (intents, scores).
+
+        All features are gathered into one flat array and summed per message
+        with a single segmented reduction, so there is no per-message NumPy call.
+        """
+        import numpy as np
+
+        if not texts:
+            return [], np.zeros(0, dtype=np.float32)
+
+        offsets, all_idx, all_vals = [], [], []
+        for text, lang in zip(texts, langs):
+            idx, vals = featurize(text, lang)
+            offsets.append(len(all_idx))
+            all_idx.extend(idx)
+            all_vals.extend(vals)
+
+        contrib = self.weights[all_idx] * np.asarray(all_vals, dtype=np.float32)[:, None]
+        scores = np.add.reduceat(contrib, offsets, axis=0) + self.bias
+        best = scores.argmax(axis=1)
+        return [self.labels[i] for i in best], scores[np.arange(len(best)), best]
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_failed = False
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> Optional[IntentClassifier]:
+    """Train the shared classifier on first use; None if it cannot be built"""
+    global _classifier, _classifier_failed
+    if _classifier is None and not _classifier_failed:
+        with _classifier_lock:
+            if _classifier is None and not _classifier_failed:
+                try:
+                    _classifier = IntentClassifier.from_file()
+                except Exception:
+                    # numpy missing or examples unreadable: keyword rules only
+                    _classifier_failed = True
+    return _classifier
+
+
+def model_version() -> str:
+    """Version of the model detect_intent(s) uses: a hash of the examples file
+    it was trained from, or "keywords" when only the rules are available"""
+    clf = get_classifier()
+    return clf.version if clf is not None else "keywords"
+
+
+def detect_intent(text: str, lang: str) -> str:
+    """Classify one message, falling back to keyword rules when unsure"""
+    user = text.lower()
+    clf = get_classifier()
+    if clf is not None:
+        intent, score = clf.predict(user, lang)
+        if score >= MIN_CONFIDENCE:
+            return intent
+    return keyword_intent(user, lang)
+
+
+def detect_intents(texts: Sequence[str], langs: Sequence[str]) -> List[str]:
+    """Batch version of detect_intent"""
+    users = [t.lower() for t in texts]
+    clf = get_classifier()
+    if clf is None:
+        return [keyword_intent(u, l) for u, l in zip(users, langs)]
+    intents, scores = clf.predict_batch(users, langs)
+    return [
+        intent if score >= MIN_CONFIDENCE else keyword_intent(u, l)
+        for intent, score, u, l in zip(intents, scores, users, langs)
+    ]
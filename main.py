@@ -1,15 +1,39 @@
 import os
+import threading
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Literal, Optional, Dict, Any
 
-from database import create_document, get_documents, db
+from database import close_backend, create_document, get_documents, get_backend, get_db
 from schemas import Demolead, Demotranscript, Demosession, Demoevent, Demoappointment
+from intent_classifier import detect_intent, detect_intents, get_classifier
 
-app = FastAPI()
+
+def _warm_up():
+    """Create the storage backend and train the intent model off the request path"""
+    for init in (get_backend, get_classifier):
+        try:
+            init()
+        except Exception:
+            pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the server starts serving immediately,
+    # even when Mongo is slow or unreachable
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    yield
+    # Flush queued and spilled writes before exiting
+    try:
+        close_backend()
+    except Exception:
+        pass
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,10 +60,13 @@ def test_database():
         "database_url": None,
         "database_name": None,
         "connection_status": "Not Connected",
+        "storage_backend": None,
         "collections": []
     }
     
     try:
+        response["storage_backend"] = get_backend().name
+        db = get_db()
         if db is not None:
             response["database"] = "✅ Available"
             response["database_url"] = "✅ Configured"
@@ -63,6 +90,11 @@ def test_database():
     
     return response
 
+@app.get("/metrics/storage")
+def storage_metrics():
+    """Storage backend health, spill backlog and replay throughput"""
+    return get_backend().metrics()
+
 # ------------------------
 # Demo receptionist endpoints
 # ------------------------
@@ -108,33 +140,9 @@ class DemoMessageResponse(BaseModel):
     reply: str
     suggestions: List[str]
 
-
-def _detect_intent(user: str, lang: str) -> str:
-    if lang == 'fr':
-        if any(k in user for k in ["rendez-vous", "rdv", "planifier", "calendrier", "disponibil"]):
-            return 'schedule'
-        if any(k in user for k in ["prix", "tarif", "coût"]):
-            return 'pricing'
-        if any(k in user for k in ["humain", "agent", "représentant"]):
-            return 'escalate'
-        if any(k in user for k in ["intégration", "google", "outlook", "slack", "zapier", "twilio"]):
-            return 'integrations'
-        return 'general'
-    else:
-        if any(k in user for k in ["appointment", "book", "schedule", "calendar", "availability"]):
-            return 'schedule'
-        if any(k in user for k in ["price", "pricing", "cost"]):
-            return 'pricing'
-        if any(k in user for k in ["human", "agent", "representative"]):
-            return 'escalate'
-        if any(k in user for k in ["integration", "google", "outlook", "slack", "zapier", "twilio"]):
-            return 'integrations'
-        return 'general'
-
 @app.post("/demo/message", response_model=DemoMessageResponse)
-async def demo_message(payload: DemoMessageRequest):
-    user_lc = payload.text.lower()
-    intent = _detect_intent(user_lc, payload.lang)
+def demo_message(payload: DemoMessageRequest):
+    intent = detect_intent(payload.text, payload.lang)
 
     if payload.lang == 'fr':
         if intent == 'schedule':
@@ -189,6 +197,22 @@ async def demo_message(payload: DemoMessageRequest):
 
     return DemoMessageResponse(reply=reply, suggestions=suggestions)
 
+# ---- Batch intent classification ----
+class ClassifyItem(BaseModel):
+    text: str = Field(..., min_length=1)
+    lang: Literal['en', 'fr'] = 'en'
+
+class ClassifyRequest(BaseModel):
+    messages: List[ClassifyItem] = Field(..., max_length=5000)
+
+class ClassifyResponse(BaseModel):
+    intents: List[str]
+
+@app.post("/demo/classify", response_model=ClassifyResponse)
+def demo_classify(payload: ClassifyRequest):
+    intents = detect_intents([m.text for m in payload.messages], [m.lang for m in payload.messages])
+    return ClassifyResponse(intents=intents)
+
 # ---- Analytics events ----
 class DemoEventRequest(BaseModel):
     session_id: str = Field(..., min_length=8)
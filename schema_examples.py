@@ -6,7 +6,7 @@ Copy and modify these examples for your specific needs.
 """
 
 from datetime import datetime
-from database import create_document, get_documents, update_document, delete_document
+from database import create_document, get_documents
 
 # =============================================================================
 # USER MANAGEMENT SCHEMA
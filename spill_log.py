@@ -0,0 +1,483 @@
+"""
+Spill Log
+
+Durable, append-only on-disk log for writes that Mongo could not accept.
+
+- SpillLog:        segmented log files in SPILL_DIR. Appends are buffered in
+                   memory and written + fsync'd by a background thread every
+                   SPILL_FSYNC_INTERVAL_MS, so callers never wait on the disk.
+- SpillingBackend: write-behind storage backend. Writes are queued and
+                   return immediately; a writer thread inserts them into Mongo
+                   and, on connection or timeout errors, appends them to the
+                   spill log instead. Requests therefore never wait on Mongo.
+                   The queue is bounded (SPILL_WRITE_QUEUE_SIZE): when it is
+                   full, or the writer has been stuck on one Mongo call for
+                   longer than the fsync interval, writes go straight to the
+                   spill log, so acknowledged writes held only in memory stay
+                   bounded even while Mongo is slow rather than down.
+                   A background replayer drains sealed segments back into
+                   Mongo with insert_many once it answers a ping.
+
+Only transient errors (see is_transient_error) spill. Documents Mongo rejects
+outright (validation, DocumentTooLarge, other write errors) go to a separate
+dead-letter log in SPILL_DIR/dead-letter with the error message, so a single
+bad record can neither mark Mongo unhealthy nor block the replay backlog.
+
+Every spilled document carries its _id, so replaying a segment twice (e.g.
+after a crash mid-replay) only produces duplicate-key errors, which are ignored.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from storage import Sort, StorageBackend, failed_write_indexes
+
+logger = logging.getLogger(__name__)
+
+SPILL_DIR = os.getenv("SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spill"))
+SEGMENT_BYTES = int(os.getenv("SPILL_SEGMENT_MB", 8)) * 1024 * 1024
+FSYNC_INTERVAL = int(os.getenv("SPILL_FSYNC_INTERVAL_MS", 100)) / 1000
+REPLAY_INTERVAL = int(os.getenv("SPILL_REPLAY_INTERVAL_MS", 1000)) / 1000
+REPLAY_BATCH_SIZE = 500
+WRITE_BATCH_SIZE = 500
+WRITE_QUEUE_SIZE = int(os.getenv("SPILL_WRITE_QUEUE_SIZE", 1000))
+
+_SEGMENT_SUFFIX = ".spill"
+_DUPLICATE_KEY = 11000
+
+
+class SpillLog:
+    """Segmented append-only log of (collection, document) records"""
+
+    def __init__(self, directory: str = SPILL_DIR, segment_bytes: int = SEGMENT_BYTES,
+                 fsync_interval: float = FSYNC_INTERVAL):
+        # Deferred: bson ships with pymongo and keeps ObjectId/datetime intact
+        from bson import json_util
+
+        self._json = json_util
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending: List[str] = []
+        self._pending_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = None
+
+        # records per sealed segment, oldest first. Sealed segments carry their
+        # record count in the file name ("<seq>-<count>.spill"); a segment left
+        # active by a crashed process has none and is counted lazily by
+        # count_segments(), off the request path
+        self._segments: "OrderedDict[str, Optional[int]]" = OrderedDict()
+        existing = sorted(
+            (f for f in os.listdir(directory) if f.endswith(_SEGMENT_SUFFIX)),
+            key=lambda f: int(f[:-len(_SEGMENT_SUFFIX)].split("-")[0]),
+        )
+        for name in existing:
+            stem = name[:-len(_SEGMENT_SUFFIX)]
+            count = int(stem.split("-")[1]) if "-" in stem else None
+            self._segments[os.path.join(directory, name)] = count
+        self._next_seq = int(existing[-1][:-len(_SEGMENT_SUFFIX)].split("-")[0]) + 1 if existing else 0
+        self._active_path = None
+        self._active_file = None
+        self._active_records = 0
+
+        self.appended_total = 0
+
+    # ---- writing ----
+
+    def append(self, collection_name: str, document: dict, error: str = None):
+        """Queue a record; it is durable after the next interval fsync"""
+        record = {"c": collection_name, "d": document}
+        if error is not None:
+            record["e"] = error
+        line = self._json.dumps(record) + "\n"
+        with self._pending_lock:
+            self._pending.append(line)
+            self.appended_total += 1
+        if self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._io_lock:
+            if self._flusher is None and not self._closed:
+                self._flusher = threading.Thread(target=self._flush_loop, name="spill-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                # disk trouble: keep the records queued and retry next interval
+                pass
+
+    def flush(self):
+        """Write queued records to the active segment and fsync it"""
+        with self._io_lock:
+            with self._pending_lock:
+                lines, self._pending = self._pending, []
+            if not lines:
+                return
+            try:
+                if self._active_file is None:
+                    self._open_segment()
+                self._active_file.write("".join(lines).encode("utf-8"))
+                self._active_file.flush()
+                os.fsync(self._active_file.fileno())
+            except OSError:
+                with self._pending_lock:
+                    self._pending[:0] = lines
+                raise
+            self._active_records += len(lines)
+            if self._active_file.tell() >= self.segment_bytes:
+                self._seal_active()
+
+    def _open_segment(self):
+        self._active_path = os.path.join(self.directory, f"{self._next_seq:012d}{_SEGMENT_SUFFIX}")
+        self._next_seq += 1
+        self._active_file = open(self._active_path, "ab")
+        self._active_records = 0
+
+    def _seal_active(self):
+        if self._active_file is None:
+            return
+        self._active_file.close()
+        stem = self._active_path[:-len(_SEGMENT_SUFFIX)]
+        sealed_path = f"{stem}-{self._active_records}{_SEGMENT_SUFFIX}"
+        os.rename(self._active_path, sealed_path)
+        self._segments[sealed_path] = self._active_records
+        self._active_path = self._active_file = None
+        self._active_records = 0
+
+    def seal(self) -> List[str]:
+        """Flush and close the active segment; return sealed segments, oldest first"""
+        self.flush()
+        with self._io_lock:
+            self._seal_active()
+            return list(self._segments)
+
+    def close(self):
+        self.flush()
+        with self._io_lock:
+            self._closed = True
+            self._seal_active()
+        self._wake.set()
+
+    def count_segments(self):
+        """Count records in segments whose file name does not record it"""
+        with self._io_lock:
+            uncounted = [path for path, count in self._segments.items() if count is None]
+        for path in uncounted:
+            count = sum(1 for _ in self.read_segment(path))
+            with self._io_lock:
+                if path in self._segments:
+                    self._segments[path] = count
+
+    # ---- reading ----
+
+    def read_segment(self, path: str) -> Iterator[Tuple[str, dict]]:
+        with open(path, "rb") as f:
+            for raw in f:
+                try:
+                    record = self._json.loads(raw)
+                except ValueError:
+                    # torn final line from a crash before fsync completed
+                    continue
+                yield record["c"], record["d"]
+
+    def remove_segment(self, path: str):
+        with self._io_lock:
+            os.remove(path)
+            self._segments.pop(path, None)
+
+    # ---- metrics ----
+
+    def backlog(self) -> dict:
+        with self._io_lock, self._pending_lock:
+            paths = list(self._segments)
+            uncounted = sum(1 for count in self._segments.values() if count is None)
+            records = sum(count or 0 for count in self._segments.values()) + self._active_records + len(self._pending)
+            if self._active_path:
+                paths.append(self._active_path)
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return {"records": records, "segments": len(paths), "uncounted_segments": uncounted, "bytes": size}
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """Connection, server-selection and timeout errors: Mongo may recover"""
+    try:
+        from pymongo.errors import AutoReconnect, ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError
+    except ImportError:
+        return isinstance(exc, (ConnectionError, TimeoutError))
+    return isinstance(exc, (AutoReconnect, ServerSelectionTimeoutError, NetworkTimeout,
+                            ExecutionTimeout, ConnectionError, TimeoutError))
+
+
+def _is_duplicate_key(exc: Exception) -> bool:
+    return getattr(exc, "code", None) == _DUPLICATE_KEY
+
+
+class SpillingBackend(StorageBackend):
+    """Write-behind primary backend; transient failures spill to disk for replay"""
+
+    name = "mongo+spill"
+
+    def __init__(self, primary: StorageBackend, log: SpillLog, dead_letter: SpillLog = None,
+                 replay_interval: float = REPLAY_INTERVAL, replay_batch_size: int = REPLAY_BATCH_SIZE,
+                 write_batch_size: int = WRITE_BATCH_SIZE, write_queue_size: int = WRITE_QUEUE_SIZE):
+        self.primary = primary
+        self.log = log
+        self.dead_letter = dead_letter or SpillLog(os.path.join(log.directory, "dead-letter"))
+        self.replay_interval = replay_interval
+        self.replay_batch_size = replay_batch_size
+        self.write_batch_size = write_batch_size
+        self.healthy = True
+        self._queue: "queue.Queue" = queue.Queue(maxsize=write_queue_size)
+        # monotonic start of the Mongo call the writer is blocked in, if any
+        self._writing_since = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._replayer = None
+
+        self.written_total = 0
+        self.spilled_total = 0
+        self.overflow_full_total = 0
+        self.overflow_stalled_total = 0
+        self.dead_lettered_total = 0
+        self.replayed_total = 0
+        self.replay_errors = 0
+        self.last_replay = {"records": 0, "seconds": 0.0, "records_per_s": 0.0, "at": None}
+
+    # ---- writes ----
+
+    def insert_one(self, collection_name: str, document: dict) -> str:
+        return self.insert_many(collection_name, [document])[0]
+
+    def insert_many(self, collection_name: str, documents: Sequence[dict]) -> List[str]:
+        from bson import ObjectId
+
+        if self._writer is None:
+            self._start_writer()
+        ids = []
+        for doc in documents:
+            # assigned up front so a write that lands in Mongo and is also
+            # spilled (e.g. timed out after commit) is deduplicated on replay
+            ids.append(str(doc.setdefault('_id', ObjectId())))
+            if self._writer_stalled():
+                self.overflow_stalled_total += 1
+                self._spill(collection_name, [doc])
+                continue
+            try:
+                self._queue.put_nowait((collection_name, doc))
+            except queue.Full:
+                self.overflow_full_total += 1
+                self._spill(collection_name, [doc])
+        return ids
+
+    def _writer_stalled(self) -> bool:
+        started = self._writing_since
+        return started is not None and time.monotonic() - started > self.log.fsync_interval
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="spill-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.write_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            items = batch[:-1] if stopping else batch
+
+            by_collection = OrderedDict()
+            for collection_name, doc in items:
+                by_collection.setdefault(collection_name, []).append(doc)
+            for collection_name, docs in by_collection.items():
+                try:
+                    self._write(collection_name, docs)
+                except Exception:
+                    logger.exception("spill: failed to persist %d %s documents", len(docs), collection_name)
+            for _ in batch:
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, collection_name: str, documents: List[dict]):
+        if not self.healthy:
+            self._spill(collection_name, documents)
+            return
+        self._writing_since = time.monotonic()
+        try:
+            dead = self._insert_or_dead_letter(collection_name, documents)
+            self.written_total += len(documents) - dead
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            self.healthy = False
+            self._spill(collection_name, documents)
+        finally:
+            self._writing_since = None
+
+    def _spill(self, collection_name: str, documents: Sequence[dict]):
+        for doc in documents:
+            self.log.append(collection_name, doc)
+        self.spilled_total += len(documents)
+
+    def _insert_or_dead_letter(self, collection_name: str, documents: List[dict]) -> int:
+        """insert_many; duplicates are ignored and permanently rejected documents
+        are dead-lettered (returns how many). Transient errors propagate."""
+        try:
+            self.primary.insert_many(collection_name, documents)
+            return 0
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            failed = failed_write_indexes(e)
+            if failed is not None:
+                messages = {err["index"]: err.get("errmsg", str(e)) for err in e.details["writeErrors"]}
+                for i in failed:
+                    self._dead_letter(collection_name, documents[i], messages[i])
+                return len(failed)
+
+        # not a per-document bulk error (e.g. DocumentTooLarge): isolate the culprit
+        dead = 0
+        for doc in documents:
+            try:
+                self.primary.insert_one(collection_name, doc)
+            except Exception as e:
+                if is_transient_error(e):
+                    raise
+                if not _is_duplicate_key(e):
+                    self._dead_letter(collection_name, doc, str(e))
+                    dead += 1
+        return dead
+
+    def _dead_letter(self, collection_name: str, document: dict, error: str):
+        logger.warning("spill: dead-lettering %s document %s: %s", collection_name, document.get('_id'), error)
+        self.dead_letter.append(collection_name, document, error=error[:500])
+        self.dead_lettered_total += 1
+
+    # ---- reads ----
+
+    def find(self, collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None) -> List[dict]:
+        return self.primary.find(collection_name, filter_dict, limit, sort)
+
+    def list_collection_names(self) -> List[str]:
+        return self.primary.list_collection_names()
+
+    # ---- replay ----
+
+    def replay(self) -> int:
+        """Drain sealed segments into the primary; returns records replayed"""
+        with self._replay_lock:
+            self.primary.ping()
+            start = time.perf_counter()
+            replayed = 0
+            for path in self.log.seal():
+                batches = OrderedDict()
+                for collection_name, doc in self.log.read_segment(path):
+                    batch = batches.setdefault(collection_name, [])
+                    batch.append(doc)
+                    if len(batch) >= self.replay_batch_size:
+                        replayed += len(batch) - self._insert_or_dead_letter(collection_name, batch)
+                        batches[collection_name] = []
+                for collection_name, batch in batches.items():
+                    if batch:
+                        replayed += len(batch) - self._insert_or_dead_letter(collection_name, batch)
+                # dead letters must be durable before their source segment goes
+                self.dead_letter.flush()
+                self.log.remove_segment(path)
+            # only trust Mongo again once the backlog actually went in
+            self.healthy = True
+
+            elapsed = time.perf_counter() - start
+            self.replayed_total += replayed
+            if replayed:
+                self.last_replay = {
+                    "records": replayed,
+                    "seconds": round(elapsed, 4),
+                    "records_per_s": round(replayed / elapsed, 1) if elapsed else 0.0,
+                    "at": time.time(),
+                }
+            return replayed
+
+    def _replay_loop(self):
+        # segments a crashed process left unsealed have no count in their name
+        self.log.count_segments()
+        while not self._stop.wait(self.replay_interval):
+            if self.healthy and not self.log.backlog()["segments"]:
+                continue
+            try:
+                self.replay()
+            except Exception as e:
+                # Mongo still down: the segment stays on disk for the next interval
+                self.healthy = False
+                self.replay_errors += 1
+                if not is_transient_error(e):
+                    logger.exception("spill: replay failed")
+
+    def start(self):
+        if self._writer is None:
+            self._start_writer()
+        if self._replayer is None:
+            self._replayer = threading.Thread(target=self._replay_loop, name="spill-replay", daemon=True)
+            self._replayer.start()
+
+    def flush(self):
+        """Block until every queued write is in Mongo or fsync'd to the spill log"""
+        if self._writer is not None:
+            self._queue.join()
+        self.log.flush()
+        self.dead_letter.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self.log.close()
+        self.dead_letter.close()
+
+    def metrics(self) -> dict:
+        return {
+            "backend": self.name,
+            "healthy": self.healthy,
+            "queue": {
+                "depth": self._queue.qsize(),
+                "max": self._queue.maxsize,
+                "overflow_full_total": self.overflow_full_total,
+                "overflow_stalled_total": self.overflow_stalled_total,
+            },
+            "backlog": self.log.backlog(),
+            "dead_letter": self.dead_letter.backlog(),
+            "written_total": self.written_total,
+            "spilled_total": self.spilled_total,
+            "dead_lettered_total": self.dead_lettered_total,
+            "replayed_total": self.replayed_total,
+            "replay_errors": self.replay_errors,
+            "last_replay": self.last_replay,
+        }
@@ -0,0 +1,411 @@
+"""
+Storage Backends
+
+The database helpers in database.py dispatch through a StorageBackend so the
+app can run against MongoDB or a self-contained in-memory engine:
+
+- MongoBackend:    thin wrapper around a pymongo Database
+- MemoryBackend:   dict-backed collections with per-field secondary indexes,
+                   for tests, deterministic benchmarks and load tests
+- DegradedBackend: writes to Mongo, buffering in memory (bounded, not
+                   durable) while Mongo is down and draining back on recovery
+
+For durable buffering of failed writes see SpillingBackend in spill_log.py.
+
+Filters support equality (including dotted paths) and {"$in": [...]}; sort
+takes a field name or a list of (field, direction) pairs like pymongo.
+"""
+
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+Sort = Union[str, Sequence[Tuple[str, int]], None]
+
+# Fields the in-memory engine indexes by default (most lookups are per session)
+DEFAULT_INDEXED_FIELDS = ("session_id",)
+
+_MISSING = object()
+
+_DUPLICATE_KEY = 11000
+
+
+class DuplicateKeyError(Exception):
+    """In-memory counterpart of pymongo's DuplicateKeyError"""
+
+    code = _DUPLICATE_KEY
+
+
+class BulkWriteError(Exception):
+    """In-memory counterpart of pymongo's BulkWriteError (same `details` shape)"""
+
+    def __init__(self, details: dict):
+        super().__init__("batch op errors occurred")
+        self.details = details
+
+
+def failed_write_indexes(exc: Exception) -> Optional[List[int]]:
+    """Indexes of documents a bulk insert rejected for reasons other than a
+    duplicate _id, or None when the error is not a bulk write error (in which
+    case it is unknown which documents were written)"""
+    details = getattr(exc, "details", None)
+    if not isinstance(details, dict) or "writeErrors" not in details or details.get("writeConcernErrors"):
+        return None
+    return [e["index"] for e in details["writeErrors"] if e.get("code") != _DUPLICATE_KEY]
+
+
+def _normalize_sort(sort: Sort) -> List[Tuple[str, int]]:
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    return [(field, direction) for field, direction in sort]
+
+
+class StorageBackend:
+    """Interface every storage engine implements"""
+
+    name = "base"
+
+    def insert_one(self, collection_name: str, document: dict) -> str:
+        raise NotImplementedError
+
+    def insert_many(self, collection_name: str, documents: Sequence[dict]) -> List[str]:
+        return [self.insert_one(collection_name, doc) for doc in documents]
+
+    def find(self, collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None) -> List[dict]:
+        raise NotImplementedError
+
+    def list_collection_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def ping(self):
+        """Raise if the backend cannot currently serve requests"""
+
+    def flush(self):
+        """Block until every accepted write is persisted"""
+
+    def close(self):
+        """Flush and release resources at shutdown"""
+
+    def metrics(self) -> dict:
+        return {"backend": self.name}
+
+
+class MongoBackend(StorageBackend):
+    """Storage on a pymongo Database"""
+
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    def insert_one(self, collection_name: str, document: dict) -> str:
+        return str(self.db[collection_name].insert_one(document).inserted_id)
+
+    def insert_many(self, collection_name: str, documents: Sequence[dict]) -> List[str]:
+        if not documents:
+            return []
+        result = self.db[collection_name].insert_many(list(documents), ordered=False)
+        return [str(i) for i in result.inserted_ids]
+
+    def find(self, collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None) -> List[dict]:
+        cursor = self.db[collection_name].find(filter_dict or {})
+        if sort:
+            cursor = cursor.sort(_normalize_sort(sort))
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def list_collection_names(self) -> List[str]:
+        return self.db.list_collection_names()
+
+    def ping(self):
+        self.db.command('ping')
+
+
+class _MemoryCollection:
+    def __init__(self, indexed_fields: Iterable[str]):
+        self.docs: Dict[str, dict] = {}
+        # field -> value -> ids, kept in insertion order
+        self.indexes: Dict[str, Dict[Any, List[str]]] = {f: {} for f in indexed_fields}
+
+    def insert(self, doc: dict) -> str:
+        doc_id = doc.setdefault('_id', uuid.uuid4().hex)
+        if str(doc_id) in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error: _id {doc_id!r}")
+        self.docs[str(doc_id)] = doc
+        for field, index in self.indexes.items():
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                try:
+                    index.setdefault(value, []).append(str(doc_id))
+                except TypeError:
+                    # unhashable values are found by scanning instead
+                    pass
+        return str(doc_id)
+
+    def remove_all(self) -> List[dict]:
+        docs = list(self.docs.values())
+        self.docs.clear()
+        for index in self.indexes.values():
+            index.clear()
+        return docs
+
+    def candidates(self, filter_dict: dict) -> Iterable[dict]:
+        """Smallest posting list among indexed equality filters, else all docs"""
+        best = None
+        for field, cond in filter_dict.items():
+            index = self.indexes.get(field)
+            if index is None or isinstance(cond, dict):
+                continue
+            try:
+                ids = index.get(cond, [])
+            except TypeError:
+                continue
+            if best is None or len(ids) < len(best):
+                best = ids
+        if best is None:
+            return self.docs.values()
+        return (self.docs[i] for i in best)
+
+
+def _get_path(doc: dict, path: str):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches(doc: dict, filter_dict: dict) -> bool:
+    for field, cond in filter_dict.items():
+        value = _get_path(doc, field)
+        if isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op == '$in':
+                    if value is _MISSING or value not in arg:
+                        return False
+                else:
+                    raise ValueError(f"Unsupported filter operator for in-memory storage: {op}")
+        elif value is _MISSING or value != cond:
+            return False
+    return True
+
+
+def _type_rank(value) -> int:
+    # BSON comparison order: null < numbers < strings < objects < arrays
+    # < binary < ObjectId < booleans < dates
+    if value is _MISSING or value is None:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, (list, tuple)):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if type(value).__name__ == "ObjectId":
+        return 6
+    if isinstance(value, datetime):
+        return 8
+    return 9
+
+
+def _sort_key(field: str):
+    def key(doc):
+        value = _get_path(doc, field)
+        rank = _type_rank(value)
+        if rank == 0:
+            return (0, 0)
+        if rank in (3, 4, 9):
+            # no natural order within these types; keep it deterministic
+            return (rank, repr(value))
+        if rank == 8 and value.tzinfo is not None:
+            # aware and naive datetimes do not compare; Mongo stores UTC
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (rank, value)
+    return key
+
+
+class MemoryBackend(StorageBackend):
+    """In-process storage with secondary indexes on selected fields"""
+
+    name = "memory"
+
+    def __init__(self, indexed_fields: Iterable[str] = DEFAULT_INDEXED_FIELDS):
+        self.indexed_fields = tuple(indexed_fields)
+        self._collections: Dict[str, _MemoryCollection] = {}
+        self._lock = threading.RLock()
+
+    def _collection(self, collection_name: str) -> _MemoryCollection:
+        coll = self._collections.get(collection_name)
+        if coll is None:
+            coll = self._collections[collection_name] = _MemoryCollection(self.indexed_fields)
+        return coll
+
+    def insert_one(self, collection_name: str, document: dict) -> str:
+        with self._lock:
+            return self._collection(collection_name).insert(document)
+
+    def insert_many(self, collection_name: str, documents: Sequence[dict]) -> List[str]:
+        # unordered, like MongoBackend: insert what we can, then report failures
+        ids, errors = [], []
+        with self._lock:
+            coll = self._collection(collection_name)
+            for i, doc in enumerate(documents):
+                try:
+                    ids.append(coll.insert(doc))
+                except DuplicateKeyError as e:
+                    errors.append({"index": i, "code": e.code, "errmsg": str(e)})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return ids
+
+    def find(self, collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None) -> List[dict]:
+        filter_dict = filter_dict or {}
+        sort_spec = _normalize_sort(sort)
+        with self._lock:
+            coll = self._collections.get(collection_name)
+            if coll is None:
+                return []
+            results = []
+            for doc in coll.candidates(filter_dict):
+                if _matches(doc, filter_dict):
+                    results.append(dict(doc))
+                    # without a sort, stop as soon as the limit is reached
+                    if limit and not sort_spec and len(results) >= limit:
+                        break
+        # stable sorts applied from the least to the most significant key
+        for field, direction in reversed(sort_spec):
+            results.sort(key=_sort_key(field), reverse=direction < 0)
+        return results[:limit] if limit else results
+
+    def list_collection_names(self) -> List[str]:
+        with self._lock:
+            return list(self._collections)
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(c.docs) for c in self._collections.values())
+
+    def pop_all(self) -> Dict[str, List[dict]]:
+        """Remove and return every document, grouped by collection"""
+        with self._lock:
+            return {name: coll.remove_all() for name, coll in self._collections.items() if coll.docs}
+
+    def clear(self):
+        with self._lock:
+            self._collections.clear()
+
+
+class DegradedBackend(StorageBackend):
+    """Mongo first; failed writes are buffered in memory and drained back later.
+
+    The buffer is NOT durable: anything still buffered is lost if the process
+    exits, and writes are rejected (the primary's error is raised) once it holds
+    max_buffered documents. It is drained into the primary, skipping documents
+    whose _id already made it there, on the next successful write or read.
+    Documents the primary rejects outright during a drain are dropped and
+    counted in metrics().
+    """
+
+    name = "mongo+memory"
+
+    def __init__(self, primary: StorageBackend, buffer: Optional[MemoryBackend] = None,
+                 max_buffered: int = 10000):
+        self.primary = primary
+        self.buffer = buffer or MemoryBackend()
+        self.max_buffered = max_buffered
+        self.rejected_total = 0
+        self.drained_total = 0
+        self.dropped_total = 0
+        self._drain_lock = threading.Lock()
+
+    def _buffer(self, collection_name: str, documents: Sequence[dict], error: Exception):
+        if self.buffer.count() + len(documents) > self.max_buffered:
+            self.rejected_total += len(documents)
+            raise error
+        try:
+            self.buffer.insert_many(collection_name, documents)
+        except BulkWriteError:
+            # already buffered by an earlier failed attempt
+            pass
+
+    def insert_one(self, collection_name: str, document: dict) -> str:
+        try:
+            doc_id = self.primary.insert_one(collection_name, document)
+        except Exception as e:
+            self._buffer(collection_name, [document], e)
+            return str(document['_id'])
+        self.drain()
+        return doc_id
+
+    def insert_many(self, collection_name: str, documents: Sequence[dict]) -> List[str]:
+        try:
+            ids = self.primary.insert_many(collection_name, documents)
+        except Exception as e:
+            failed = failed_write_indexes(e)
+            pending = list(documents) if failed is None else [documents[i] for i in failed]
+            if pending:
+                self._buffer(collection_name, pending, e)
+            return [str(doc.get('_id')) for doc in documents]
+        self.drain()
+        return ids
+
+    def drain(self) -> int:
+        """Move buffered documents into the primary; returns how many were written"""
+        if not self.buffer.count() or not self._drain_lock.acquire(blocking=False):
+            return 0
+        drained = 0
+        try:
+            batches = list(self.buffer.pop_all().items())
+            for i, (collection_name, documents) in enumerate(batches):
+                try:
+                    self.primary.insert_many(collection_name, documents)
+                    drained += len(documents)
+                except Exception as e:
+                    failed = failed_write_indexes(e)
+                    if failed is None:
+                        # primary unavailable: keep this and the remaining batches
+                        for name, docs in batches[i:]:
+                            self.buffer.insert_many(name, docs)
+                        break
+                    # duplicates were already written; other rejections are final
+                    drained += len(documents) - len(failed)
+                    self.dropped_total += len(failed)
+        finally:
+            self._drain_lock.release()
+        self.drained_total += drained
+        return drained
+
+    def find(self, collection_name: str, filter_dict: dict = None, limit: int = None, sort: Sort = None) -> List[dict]:
+        try:
+            self.drain()
+            return self.primary.find(collection_name, filter_dict, limit, sort)
+        except Exception:
+            return self.buffer.find(collection_name, filter_dict, limit, sort)
+
+    def list_collection_names(self) -> List[str]:
+        try:
+            return self.primary.list_collection_names()
+        except Exception:
+            return self.buffer.list_collection_names()
+
+    def metrics(self) -> dict:
+        return {
+            "backend": self.name,
+            "durable": False,
+            "buffered": self.buffer.count(),
+            "max_buffered": self.max_buffered,
+            "rejected_total": self.rejected_total,
+            "drained_total": self.drained_total,
+            "dropped_total": self.dropped_total,
+        }
@@ -0,0 +1,179 @@
+import os
+import threading
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from spill_log import SpillLog, SpillingBackend
+from storage import MemoryBackend
+
+
+@pytest.fixture
+def spill_dir(tmp_path):
+    return str(tmp_path / "spill")
+
+
+def _backend(primary, spill_dir, **kwargs):
+    return SpillingBackend(primary, SpillLog(spill_dir, fsync_interval=0.01), **kwargs)
+
+
+def test_outage_spills_and_replays_without_duplicates(flaky, spill_dir):
+    backend = _backend(flaky, spill_dir)
+    flaky.down = True
+    ids = [backend.insert_one('lead', {'i': i}) for i in range(20)]
+    backend.flush()
+    assert not backend.healthy
+    assert backend.metrics()['backlog']['records'] == 20
+
+    flaky.down = False
+    assert flaky.find('lead') == []
+    # one write landed in Mongo before the connection dropped
+    first = next(backend.log.read_segment(backend.log.seal()[0]))[1]
+    MemoryBackend.insert_one(flaky, 'lead', dict(first))
+
+    assert backend.replay() == 20
+    assert sorted(str(d['_id']) for d in flaky.find('lead')) == sorted(ids)
+    assert backend.healthy
+    assert backend.metrics()['backlog']['records'] == 0
+    assert [f for f in os.listdir(spill_dir) if f.endswith('.spill')] == []
+    backend.close()
+
+
+def test_replay_keeps_segment_while_primary_is_down(flaky, spill_dir):
+    backend = _backend(flaky, spill_dir)
+    flaky.down = True
+    backend.insert_one('lead', {'i': 1})
+    backend.flush()
+    with pytest.raises(AutoReconnect):
+        backend.replay()
+    assert backend.metrics()['backlog']['records'] == 1
+    backend.close()
+
+
+def test_rejected_document_is_dead_lettered_not_spilled(flaky, spill_dir):
+    backend = _backend(flaky, spill_dir)
+    backend.insert_one('lead', {'bad': True})
+    backend.insert_one('lead', {'ok': True})
+    backend.flush()
+    metrics = backend.metrics()
+    assert backend.healthy
+    assert metrics['dead_lettered_total'] == 1
+    assert metrics['backlog']['records'] == 0
+    assert len(flaky.find('lead')) == 1
+    backend.close()
+
+
+def test_rejected_document_does_not_block_replay(flaky, spill_dir):
+    backend = _backend(flaky, spill_dir)
+    flaky.down = True
+    backend.insert_one('lead', {'i': 0})
+    backend.insert_one('lead', {'i': 1, 'bad': True})
+    backend.insert_one('lead', {'i': 2})
+    backend.flush()
+
+    flaky.down = False
+    assert backend.replay() == 2
+    assert sorted(d['i'] for d in flaky.find('lead')) == [0, 2]
+    assert backend.metrics()['backlog']['records'] == 0
+
+    dead = backend.dead_letter.seal()
+    records = [doc for path in dead for _, doc in backend.dead_letter.read_segment(path)]
+    assert [doc['i'] for doc in records] == [1]
+    backend.close()
+
+
+def test_torn_line_is_skipped_and_counted_lazily(spill_dir):
+    log = SpillLog(spill_dir)
+    log.append('lead', {'_id': 'a'})
+    log.append('lead', {'_id': 'b'})
+    log.flush()
+    active = log._active_path
+    # crash: the active segment is never sealed and its last write is torn
+    with open(active, "ab") as f:
+        f.write(b'{"c": "lead", "d": {"_id": "c"')
+
+    reopened = SpillLog(spill_dir)
+    assert reopened.backlog()['uncounted_segments'] == 1
+    reopened.count_segments()
+    assert reopened.backlog()['records'] == 2
+    assert [doc['_id'] for _, doc in reopened.read_segment(active)] == ['a', 'b']
+
+
+def test_sealed_segment_count_is_read_from_file_name(spill_dir, monkeypatch):
+    log = SpillLog(spill_dir)
+    for i in range(3):
+        log.append('lead', {'_id': i})
+    log.close()
+
+    def no_scan(self, path):
+        raise AssertionError("segment scanned at startup")
+
+    monkeypatch.setattr(SpillLog, "read_segment", no_scan)
+    reopened = SpillLog(spill_dir)
+    assert reopened.backlog()['records'] == 3
+    assert reopened.backlog()['uncounted_segments'] == 0
+
+
+class SlowBackend(MemoryBackend):
+    """Primary that is slow but not failing: inserts block until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+    def insert_many(self, collection_name, documents):
+        self.entered.set()
+        self.release.wait()
+        return super().insert_many(collection_name, documents)
+
+
+def test_slow_primary_overflows_to_spill_log(spill_dir):
+    primary = SlowBackend()
+    backend = _backend(primary, spill_dir, write_queue_size=5, write_batch_size=1)
+    backend.insert_one('lead', {'i': 0})
+    primary.entered.wait(1)
+
+    # writer is stuck on the first document for longer than the fsync interval
+    threading.Event().wait(0.05)
+    for i in range(1, 10):
+        backend.insert_one('lead', {'i': i})
+    queue_metrics = backend.metrics()['queue']
+    assert queue_metrics['depth'] == 0
+    assert queue_metrics['overflow_stalled_total'] == 9
+
+    primary.release.set()
+    backend.flush()
+    assert backend.metrics()['backlog']['records'] == 9
+    assert backend.replay() == 9
+    assert sorted(d['i'] for d in primary.find('lead')) == list(range(10))
+    backend.close()
+
+
+def test_full_queue_overflows_to_spill_log(spill_dir):
+    primary = SlowBackend()
+    backend = _backend(primary, spill_dir, write_queue_size=3, write_batch_size=1)
+    backend.log.fsync_interval = 60  # never considered stalled
+    backend.insert_one('lead', {'i': 0})
+    primary.entered.wait(1)
+    for i in range(1, 8):
+        backend.insert_one('lead', {'i': i})
+    queue_metrics = backend.metrics()['queue']
+    assert (queue_metrics['depth'], queue_metrics['overflow_full_total']) == (3, 4)
+
+    primary.release.set()
+    backend.flush()
+    assert len(primary.find('lead')) == 4
+    assert backend.replay() == 4
+    assert sorted(d['i'] for d in primary.find('lead')) == list(range(8))
+    backend.close()
+
+
+def test_flush_waits_for_queued_writes(flaky, spill_dir):
+    backend = _backend(flaky, spill_dir)
+    for i in range(100):
+        backend.insert_one('lead', {'i': i})
+    backend.flush()
+    assert len(flaky.find('lead')) == 100
+    assert backend.metrics()['queue']['depth'] == 0
+    backend.close()
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from storage import BulkWriteError, DegradedBackend, DuplicateKeyError, MemoryBackend, failed_write_indexes
+
+
+@pytest.fixture
+def memory():
+    backend = MemoryBackend()
+    backend.insert_many('transcript', [
+        {'_id': str(i), 'session_id': f"s{i % 3}", 'role': 'user' if i % 2 else 'assistant', 'n': i, 'meta': {'k': i % 2}}
+        for i in range(10)
+    ])
+    return backend
+
+
+def test_indexed_lookup_matches_scan(memory):
+    docs = memory.find('transcript', {'session_id': 's1'})
+    assert [d['n'] for d in docs] == [1, 4, 7]
+    assert [d['n'] for d in memory.find('transcript', {'session_id': 's1', 'role': 'user'})] == [1, 7]
+    assert memory.find('transcript', {'session_id': 'missing'}) == []
+
+
+def test_in_and_dotted_filters(memory):
+    docs = memory.find('transcript', {'session_id': {'$in': ['s0', 's2']}, 'meta.k': 1})
+    assert [d['n'] for d in docs] == [3, 5, 9]
+
+
+def test_unsupported_operator_raises(memory):
+    with pytest.raises(ValueError):
+        memory.find('transcript', {'n': {'$gt': 3}})
+
+
+def test_sort_and_limit(memory):
+    docs = memory.find('transcript', {'role': 'user'}, limit=2, sort=[('n', -1)])
+    assert [d['n'] for d in docs] == [9, 7]
+    docs = memory.find('transcript', sort=[('meta.k', 1), ('n', -1)], limit=3)
+    assert [d['n'] for d in docs] == [8, 6, 4]
+
+
+def test_sort_across_mixed_types():
+    backend = MemoryBackend()
+    values = ['b', 2, None, True, 1.5, [1], {'a': 1}, datetime(2024, 1, 1), datetime(2023, 1, 1, tzinfo=timezone.utc)]
+    backend.insert_many('c', [{'v': v} for v in values])
+    backend.insert_one('c', {'other': 1})
+    assert [d.get('v') for d in backend.find('c', sort='v')] == [
+        None, None, 1.5, 2, 'b', {'a': 1}, [1], True, datetime(2023, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 1),
+    ]
+
+
+def test_find_returns_copies(memory):
+    memory.find('transcript', {'session_id': 's0'})[0]['n'] = 'changed'
+    assert memory.find('transcript', {'session_id': 's0'})[0]['n'] == 0
+
+
+def test_duplicate_id_raises_and_is_not_indexed_twice():
+    backend = MemoryBackend()
+    backend.insert_one('c', {'_id': 'a', 'session_id': 's'})
+    with pytest.raises(DuplicateKeyError):
+        backend.insert_one('c', {'_id': 'a', 'session_id': 's'})
+    assert len(backend.find('c', {'session_id': 's'})) == 1
+
+
+def test_insert_many_is_unordered_and_reports_duplicates():
+    backend = MemoryBackend()
+    backend.insert_one('c', {'_id': 'a'})
+    with pytest.raises(BulkWriteError) as exc:
+        backend.insert_many('c', [{'_id': 'b'}, {'_id': 'a'}, {'_id': 'c'}])
+    assert [e['index'] for e in exc.value.details['writeErrors']] == [1]
+    assert failed_write_indexes(exc.value) == []
+    assert sorted(d['_id'] for d in backend.find('c')) == ['a', 'b', 'c']
+
+
+def test_degraded_buffers_and_drains_without_duplicates(flaky):
+    backend = DegradedBackend(flaky)
+    flaky.down = True
+    ids = [backend.insert_one('c', {'i': i}) for i in range(3)]
+    assert backend.metrics()['buffered'] == 3
+    assert len(backend.find('c')) == 3  # served from the buffer while down
+
+    # a write that reached Mongo before the connection dropped
+    flaky.down = False
+    MemoryBackend.insert_one(flaky, 'c', dict(backend.buffer.find('c')[0]))
+
+    assert sorted(d['_id'] for d in backend.find('c')) == sorted(ids)
+    assert backend.metrics()['buffered'] == 0
+    assert backend.metrics()['drained_total'] == 3
+
+
+def test_degraded_buffer_is_capped(flaky):
+    backend = DegradedBackend(flaky, max_buffered=2)
+    flaky.down = True
+    backend.insert_one('c', {'i': 0})
+    backend.insert_one('c', {'i': 1})
+    with pytest.raises(AutoReconnect):
+        backend.insert_one('c', {'i': 2})
+    metrics = backend.metrics()
+    assert (metrics['buffered'], metrics['rejected_total'], metrics['durable']) == (2, 1, False)
+
+
+def test_degraded_partial_bulk_error_buffers_only_failed(flaky):
+    backend = DegradedBackend(flaky)
+    MemoryBackend.insert_one(flaky, 'c', {'_id': 'dup'})
+    backend.insert_many('c', [{'_id': 'dup'}, {'_id': 'ok'}, {'_id': 'bad', 'bad': True}])
+    assert [d['_id'] for d in backend.buffer.find('c')] == ['bad']